@@ -0,0 +1,331 @@
+import os
+import re
+import csv
+import json
+import time
+import sqlite3
+import argparse
+from typing import Iterator, List, Optional, Set, Tuple
+
+
+# Streams sessions (and per-session event counts) out of the ADK session DB in keyset pages,
+# flattens the structured plan fields from session state and appends them to a CSV file
+# or a Parquet dataset (one part file per run, needs pyarrow).
+#
+# Incremental runs resume from the second of the last exported `update_time` (inclusive; SQLite stores
+# whole seconds), so rows that land in that second after the run are not skipped. The checkpoint also keeps
+# the (app_name, user_id, id) keys already exported in that second, which are skipped on resume, so a run
+# with nothing new exports 0 rows. Sessions updated again in a later run still appear once per run;
+# consumers keep the latest row per session_id.
+# The checkpoint only advances over durable data: after each fsynced CSV page, or once the Parquet
+# part file is closed (one checkpoint per part).
+# --full rewrites the CSV file / replaces the part files of the Parquet directory.
+#
+# Usage:
+#   python export_sessions.py --out bookings.csv
+#   python export_sessions.py --format parquet --out bookings_parquet/ --page-size 1000
+
+
+COLUMNS = [
+    "app_name", "user_id", "session_id", "create_time", "update_time",
+    "location", "date", "start_time", "duration_hr", "guests", "occasion", "vibe",
+    "budget_total", "budget_band",
+    "yacht_id", "yacht_name", "yacht_location", "theme_id", "theme_name",
+    "total_charter_cost", "within_budget", "converted",
+    "event_count", "user_turns",
+]
+
+# Sentinel written by the pipeline's stage fallbacks (sub_agents/schemas.py) when no plan could be built
+UNMATCHED_ID = "unmatched"
+
+BUDGET_BANDS = [(25000, "<25k"), (50000, "25k-50k"), (100000, "50k-100k")]
+
+
+# --- 1. Helpers for state blobs (parsed dicts, or legacy fenced JSON strings)
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+
+def load_blob(value) -> dict:
+    """ Returns a state value as a dict. Older sessions stored raw model text, often fenced. """
+    if isinstance(value, dict):
+        return value
+    if not isinstance(value, str):
+        return {}
+    text = _FENCE_RE.sub("", value.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        parsed = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def find_key(data, key: str):
+    """ First value stored under `key` anywhere in a nested dict (plan shapes vary between versions). """
+    if isinstance(data, dict):
+        if data.get(key) is not None:
+            return data[key]
+        for value in data.values():
+            found = find_key(value, key)
+            if found is not None:
+                return found
+    return None
+
+
+def budget_band(budget) -> Optional[str]:
+    if not isinstance(budget, (int, float)):
+        return None
+    for limit, label in BUDGET_BANDS:
+        if budget < limit:
+            return label
+    return "100k+"
+
+
+def flatten_session(row: sqlite3.Row, event_stats: dict) -> dict:
+    """ Extracts one output record from a sessions row. """
+    try:
+        state = json.loads(row["state"] or "{}")
+    except ValueError:
+        state = {}
+    requirements = load_blob(state.get("user_requirements"))
+    yacht = load_blob(state.get("matched_yacht_data"))
+    theme = load_blob(state.get("matched_theme_data"))
+    plan = load_blob(state.get("combined_plan_data"))
+    vibe = requirements.get("vibe")
+    events, user_turns = event_stats.get(row["id"], (0, 0))
+
+    return {
+        "app_name": row["app_name"],
+        "user_id": row["user_id"],
+        "session_id": row["id"],
+        "create_time": row["create_time"],
+        "update_time": row["update_time"],
+        "location": requirements.get("location"),
+        "date": requirements.get("date"),
+        "start_time": requirements.get("start_time"),
+        "duration_hr": requirements.get("duration_hr"),
+        "guests": requirements.get("guests"),
+        "occasion": requirements.get("occasion"),
+        "vibe": ",".join(vibe) if isinstance(vibe, list) else vibe,
+        "budget_total": requirements.get("budget_total"),
+        "budget_band": budget_band(requirements.get("budget_total")),
+        "yacht_id": yacht.get("id") or find_key(plan, "yacht_id"),
+        "yacht_name": yacht.get("yacht_name") or find_key(plan, "yacht_name"),
+        "yacht_location": yacht.get("location"),
+        "theme_id": theme.get("id") or find_key(plan, "theme_id"),
+        "theme_name": theme.get("theme_name"),
+        "total_charter_cost": find_key(plan, "total_charter_cost"),
+        "within_budget": plan.get("within_budget"),
+        "converted": bool(plan) and find_key(plan, "yacht_id") != UNMATCHED_ID,
+        "event_count": events,
+        "user_turns": user_turns,
+    }
+
+
+# --- 2. Keyset-paged reads (the cursor steps through rows; nothing is loaded in full)
+
+def iter_session_pages(conn: sqlite3.Connection, since: Optional[str], page_size: int) -> Iterator[List[sqlite3.Row]]:
+    """ Yields pages of sessions with update_time >= `since`, ordered by (update_time, app_name, user_id, id).
+    Pages after the first continue strictly after the previous page's last key. """
+    since = since or ""
+    key = None
+    while True:
+        if key:
+            cursor = conn.execute(
+                "SELECT app_name, user_id, id, state, create_time, update_time FROM sessions "
+                "WHERE update_time >= ? AND (update_time, app_name, user_id, id) > (?, ?, ?, ?) "
+                "ORDER BY update_time, app_name, user_id, id LIMIT ?",
+                (since, *key, page_size),
+            )
+        else:
+            cursor = conn.execute(
+                "SELECT app_name, user_id, id, state, create_time, update_time FROM sessions "
+                "WHERE update_time >= ? "
+                "ORDER BY update_time, app_name, user_id, id LIMIT ?",
+                (since, page_size),
+            )
+        page = cursor.fetchall()
+        if not page:
+            return
+        yield page
+        last = page[-1]
+        key = [last["update_time"], last["app_name"], last["user_id"], last["id"]]
+
+
+def event_stats_for(conn: sqlite3.Connection, page: List[sqlite3.Row]) -> dict:
+    """ session_id -> (event_count, user_turns) for one page of sessions, aggregated in the DB. """
+    ids = [row["id"] for row in page]
+    placeholders = ",".join("?" for _ in ids)
+    cursor = conn.execute(
+        f"SELECT session_id, COUNT(*), SUM(author = 'user') FROM events "
+        f"WHERE session_id IN ({placeholders}) GROUP BY session_id",
+        ids,
+    )
+    return {session_id: (count, user_turns or 0) for session_id, count, user_turns in cursor}
+
+
+# --- 3. Writers
+
+class CsvSink:
+    """ Appends rows to a single CSV file (or rewrites it when `overwrite`); the header is written only for a new file.
+    Every page is flushed and fsynced, so the run can be checkpointed after each page. """
+    checkpoint_per_page = True
+
+    def __init__(self, path: str, overwrite: bool = False):
+        is_new = overwrite or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "w" if overwrite else "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=COLUMNS)
+        if is_new:
+            self.writer.writeheader()
+
+    def write(self, rows: List[dict]):
+        self.writer.writerows(rows)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """ Writes one row group per page into a new part file of a Parquet dataset directory.
+    The part file is only created once the first page arrives, so no-op runs leave nothing behind.
+    It is only complete (footer written and fsynced) after close(), so the run is checkpointed once at the end.
+    `overwrite` removes the existing part files first. """
+    checkpoint_per_page = False
+
+    def __init__(self, path: str, overwrite: bool = False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet export needs pyarrow (pip install pyarrow), or use --format csv.")
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.part = None
+        self.writer = None
+        os.makedirs(path, exist_ok=True)
+        if overwrite:
+            for name in os.listdir(path):
+                if name.startswith("part-") and name.endswith(".parquet"):
+                    os.remove(os.path.join(path, name))
+        self.schema = pa.schema([
+            (c, pa.float64() if c in ("duration_hr", "budget_total", "total_charter_cost")
+             else pa.int64() if c in ("guests", "event_count", "user_turns")
+             else pa.bool_() if c in ("within_budget", "converted")
+             else pa.string())
+            for c in COLUMNS
+        ])
+
+    def write(self, rows: List[dict]):
+        if self.writer is None:
+            self.part = os.path.join(self.path, f"part-{int(time.time() * 1000)}.parquet")
+            self.writer = self.pq.ParquetWriter(self.part, self.schema)
+        columns = {c: [_coerce(row[c], self.schema.field(c).type, self.pa) for row in rows] for c in COLUMNS}
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            with open(self.part, "rb") as f:
+                os.fsync(f.fileno())
+
+
+def _coerce(value, arrow_type, pa):
+    """ Model output is loosely typed (e.g. guests as "5"); unparseable values become null. """
+    if value is None:
+        return None
+    try:
+        if pa.types.is_floating(arrow_type):
+            return float(value)
+        if pa.types.is_integer(arrow_type):
+            return int(float(value))
+        if pa.types.is_boolean(arrow_type):
+            return bool(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+# --- 4. Checkpoint (last exported second and the session keys exported within it)
+
+def session_key(row: sqlite3.Row) -> Tuple[str, str, str]:
+    return row["app_name"], row["user_id"], row["id"]
+
+
+def read_checkpoint(path: str) -> Tuple[Optional[str], Set[tuple]]:
+    """ Returns the checkpoint's update_time truncated to the second ('YYYY-MM-DD HH:MM:SS')
+    and the keys already exported in that second. """
+    if not os.path.exists(path):
+        return None, set()
+    with open(path, "r") as f:
+        data = json.load(f)
+    update_time = data.get("update_time")
+    if not update_time:
+        return None, set()
+    return update_time[:19], {tuple(key) for key in data.get("keys", [])}
+
+
+def write_checkpoint(path: str, update_time: str, keys: Set[tuple]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"update_time": update_time, "keys": sorted(keys)}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# --- 5. Export run
+
+def export(db_path: str, out: str, fmt: str, page_size: int, checkpoint: str, full: bool) -> int:
+    since, seen = (None, set()) if full else read_checkpoint(checkpoint)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    sink = ParquetSink(out, overwrite=full) if fmt == "parquet" else CsvSink(out, overwrite=full)
+    # Last exported second and the keys exported in it; carried over while the run stays in the checkpoint's second
+    last_second, last_keys = since, set(seen)
+    exported = 0
+    try:
+        for page in iter_session_pages(conn, since, page_size):
+            rows = [row for row in page if row["update_time"][:19] != since or session_key(row) not in seen]
+            for row in rows:
+                if row["update_time"][:19] != last_second:
+                    last_second, last_keys = row["update_time"][:19], set()
+                last_keys.add(session_key(row))
+            if not rows:
+                continue
+            stats = event_stats_for(conn, rows)
+            sink.write([flatten_session(row, stats) for row in rows])
+            exported += len(rows)
+            # CSV pages are durable once written, so an interrupted run resumes after the last page
+            if sink.checkpoint_per_page:
+                write_checkpoint(checkpoint, last_second, last_keys)
+    finally:
+        sink.close()
+        conn.close()
+    # Parquet: the part file is complete only now; an interrupted run leaves the checkpoint where it was
+    if exported and not sink.checkpoint_per_page:
+        write_checkpoint(checkpoint, last_second, last_keys)
+    return exported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream sessions from the session DB into CSV or Parquet.")
+    parser.add_argument("--db", default=os.path.abspath("my_agent_data.db"), help="SQLite session DB")
+    parser.add_argument("--out", default="sessions_export.csv", help="CSV file, or directory for Parquet parts")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--page-size", type=int, default=500, help="Sessions fetched per page")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <out>.checkpoint.json)")
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and rewrite the output with everything")
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or f"{args.out.rstrip('/')}.checkpoint.json"
+    exported = export(args.db, args.out, args.format, max(1, args.page_size), checkpoint, args.full)
+    print(f"Exported {exported} sessions to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import argparse
+import statistics
+import urllib.error
+import urllib.request
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Replays traces captured by server.py (CAPTURE_TRACE_FILE) against a running server
+# and reports latency distribution, error rate and session-DB growth.
+# Start the server with STUB_MODEL=1 (optionally STUB_LATENCY_MS / STUB_JITTER_MS) to run fully offline;
+# each request then tells the stub whether the recorded turn ran the planning pipeline (X-Stub-Pipeline).
+# Replayed user ids get a fresh per-run prefix unless --user-prefix is given, so every run starts new sessions.
+#
+# Usage:
+#   python replay.py traces.ndjson --url http://localhost:8000 --speed 2 --concurrency 8
+#   --speed 1 keeps the recorded inter-arrival times, 2 replays twice as fast, 0 sends as fast as possible.
+
+
+# --- 1. Load traces
+
+def load_traces(path: str) -> list:
+    """ Reads an NDJSON trace file, skipping blank or malformed lines, ordered by capture time. """
+    traces = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                traces.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return sorted(traces, key=lambda t: t.get("t", 0))
+
+
+# --- 2. Session DB stats (sessions / events rows and file size)
+
+def db_stats(db_path: str) -> dict:
+    if not db_path or not os.path.exists(db_path):
+        return {}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        stats = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("sessions", "events")}
+    finally:
+        conn.close()
+    stats["bytes"] = os.path.getsize(db_path)
+    return stats
+
+
+# --- 3. Send a single request
+
+def ran_pipeline(trace: dict) -> Optional[bool]:
+    """ Whether the recorded turn called the planning pipeline (None for traces without an event sequence). """
+    events = trace.get("events")
+    if events is None:
+        return None
+    return any(kind == "call:planningPipeline" for _, kind in events)
+
+
+def post_chat(url: str, user_id: str, message: str, timeout: float, pipeline: Optional[bool]) -> tuple:
+    """ Returns (status, error, sent). `sent` is taken in the worker thread right before the request goes out. """
+    body = json.dumps({"user_id": user_id, "message": message}).encode()
+    headers = {"Content-Type": "application/json"}
+    if pipeline is not None:
+        # Only honoured by a server running with STUB_MODEL=1
+        headers["X-Stub-Pipeline"] = "1" if pipeline else "0"
+    request = urllib.request.Request(f"{url.rstrip('/')}/chat", data=body, headers=headers)
+    sent = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception as e:
+        return None, type(e).__name__, sent
+    return status, None if status == 200 else f"HTTP {status}", sent
+
+
+async def replay(traces: list, url: str, speed: float, concurrency: int, timeout: float, user_prefix: str) -> list:
+    """ Re-issues traces at recorded (or scaled) offsets, at most `concurrency` in flight.
+    Requests of the same recorded user are kept in order so multi-turn sessions stay coherent. """
+    semaphore = asyncio.Semaphore(concurrency)
+    # One worker thread per allowed in-flight request (the loop's default executor stops at cpu + 4)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    loop = asyncio.get_running_loop()
+    user_locks = {}
+    results = []
+    origin = traces[0].get("t", 0) if traces else 0
+    started = time.perf_counter()
+
+    async def _run(trace: dict):
+        # Latency is measured from the scheduled send time, so time spent queued behind the
+        # per-user lock or the concurrency limit counts (no coordinated omission)
+        scheduled = started + ((trace.get("t", origin) - origin) / speed if speed > 0 else 0.0)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        user_id = f"{user_prefix}{trace.get('user', 'anonymous')}"
+        lock = user_locks.setdefault(user_id, asyncio.Lock())
+        async with lock, semaphore:
+            status, error, sent = await loop.run_in_executor(
+                executor, post_chat, url, user_id, trace.get("message", ""), timeout, ran_pipeline(trace)
+            )
+            finished = time.perf_counter()
+            results.append({
+                "latency_ms": (finished - scheduled) * 1000,
+                "service_ms": (finished - sent) * 1000,
+                "recorded_ms": trace.get("latency_ms"),
+                "status": status,
+                "error": error,
+            })
+
+    try:
+        await asyncio.gather(*(_run(trace) for trace in traces))
+    finally:
+        executor.shutdown(wait=False)
+    return results
+
+
+# --- 4. Report
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def distribution(values: list) -> dict:
+    return {
+        "mean": round(statistics.mean(values), 1),
+        "p50": round(percentile(values, 50), 1),
+        "p90": round(percentile(values, 90), 1),
+        "p95": round(percentile(values, 95), 1),
+        "p99": round(percentile(values, 99), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def build_report(results: list, elapsed_s: float, db_before: dict, db_after: dict) -> dict:
+    latencies = [r["latency_ms"] for r in results if r["error"] is None]
+    service_times = [r["service_ms"] for r in results if r["error"] is None]
+    recorded = [r["recorded_ms"] for r in results if r["recorded_ms"] is not None]
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    report = {
+        "requests": len(results),
+        "errors": sum(errors.values()),
+        "error_rate": round(sum(errors.values()) / len(results), 4) if results else 0.0,
+        "error_breakdown": errors,
+        "elapsed_s": round(elapsed_s, 2),
+        "throughput_rps": round(len(results) / elapsed_s, 2) if elapsed_s else 0.0,
+    }
+    if latencies:
+        # latency_ms: scheduled send -> response (includes client-side queueing)
+        # service_ms: request actually sent -> response
+        report["latency_ms"] = distribution(latencies)
+        report["service_ms"] = distribution(service_times)
+    if recorded:
+        report["recorded_latency_ms"] = {"p50": round(percentile(recorded, 50), 1), "p95": round(percentile(recorded, 95), 1)}
+    if db_before and db_after:
+        report["db_growth"] = {key: db_after[key] - db_before[key] for key in db_after}
+    return report
+
+
+# --- 5. CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured /chat traces against a running server.")
+    parser.add_argument("trace_file", help="NDJSON file written by server.py capture mode")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the running server")
+    parser.add_argument("--speed", type=float, default=1.0, help="Rate multiplier (1 = recorded rate, 0 = no delays)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--user-prefix", default=None, help="Prefix for replayed user ids (default: unique per run)")
+    parser.add_argument("--db", default=os.path.abspath("my_agent_data.db"), help="Session DB used by the server")
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N traces")
+    args = parser.parse_args()
+
+    user_prefix = args.user_prefix if args.user_prefix is not None else f"replay-{uuid.uuid4().hex[:8]}-"
+    traces = load_traces(args.trace_file)
+    if args.limit:
+        traces = traces[:args.limit]
+    print(f"Replaying {len(traces)} traces against {args.url} as {user_prefix}* "
+          f"(speed x{args.speed}, concurrency {args.concurrency})")
+
+    db_before = db_stats(args.db)
+    started = time.perf_counter()
+    results = asyncio.run(replay(traces, args.url, args.speed, max(1, args.concurrency), args.timeout, user_prefix))
+    report = build_report(results, time.perf_counter() - started, db_before, db_stats(args.db))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
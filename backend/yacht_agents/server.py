@@ -1,7 +1,13 @@
 import os
+import re
 import sys
+import json
+import time
+import asyncio
+import hashlib
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware # Added CORS
@@ -24,6 +30,7 @@ try:
     from sub_agents.planning_agents import planning_agent
     from sub_agents.compilation_agent import compilation_agent
     from sub_agents.presentation_agent import presentation_agent
+    from stub_model import use_stub_models, stub_run_pipeline
 except ImportError:
     # Fallback/Debug if imports fail in the server context
     print("Error: Could not import sub_agents. Ensure sub_agents directory is on the path.")
@@ -38,6 +45,62 @@ session_service: DatabaseSessionService = None
 root_agent: Agent = None
 
 
+# --- STUB MODEL (optional) ---
+# Set STUB_MODEL=1 to run all agents against stub_model.StubLlm (no Gemini calls), e.g. for replay.py.
+STUB_MODEL = os.getenv("STUB_MODEL") == "1"
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+STUB_JITTER_MS = float(os.getenv("STUB_JITTER_MS", "0"))
+
+
+# --- CAPTURE MODE (optional) ---
+# Set CAPTURE_TRACE_FILE=traces.ndjson to append one anonymized trace per /chat call.
+# The file is the input of replay.py (load testing). CAPTURE_SALT changes the id hashing.
+CAPTURE_TRACE_FILE = os.getenv("CAPTURE_TRACE_FILE")
+CAPTURE_SALT = os.getenv("CAPTURE_SALT", "")
+capture_lock = asyncio.Lock()
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+PHONE_RE = re.compile(r"\+?\d(?:[\s-]?\d){9,}")
+
+
+def anonymize_id(value: str) -> str:
+    """ Stable, non-reversible id so traces keep their session grouping. """
+    return hashlib.sha256(f"{CAPTURE_SALT}{value}".encode()).hexdigest()[:16]
+
+
+def scrub_text(text: str) -> str:
+    """ Removes e-mail addresses and phone numbers from captured text. """
+    return PHONE_RE.sub("<phone>", EMAIL_RE.sub("<email>", text or ""))
+
+
+def describe_event(event) -> list:
+    """ Compact [author, kind] entry for the event sequence of a trace. """
+    kind = "text"
+    if event.content and event.content.parts:
+        part = event.content.parts[0]
+        if part.function_call:
+            kind = f"call:{part.function_call.name}"
+        elif part.function_response:
+            kind = f"response:{part.function_response.name}"
+    return [event.author, kind]
+
+
+def append_line(path: str, line: str):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+async def capture_trace(record: dict):
+    """ Appends one trace as a single compact NDJSON line, off the event loop.
+    Capture is best effort: a failed write is logged and never affects the chat response. """
+    try:
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+        async with capture_lock:
+            await asyncio.to_thread(append_line, CAPTURE_TRACE_FILE, line)
+    except Exception as e:
+        logging.getLogger(__name__).warning("Trace capture failed: %s", e)
+
+
 # --- FASTAPI SETUP ---
 app = FastAPI(title="Yacht Matchmaker Agent API")
 
@@ -114,6 +177,11 @@ async def initialize_adk_components():
                 """,
         tools=[sequential_agent_tool]
     )
+
+    # Offline load testing: answer every agent from canned outputs instead of Gemini
+    if STUB_MODEL:
+        use_stub_models(root_agent, latency_ms=STUB_LATENCY_MS, jitter_ms=STUB_JITTER_MS)
+        print(f"STUB_MODEL enabled (latency {STUB_LATENCY_MS} ms + up to {STUB_JITTER_MS} ms jitter)")
     
    
 
@@ -136,7 +204,7 @@ app.router.lifespan_context = lifespan
 # ----------------------------------------------------------------------
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, x_stub_pipeline: Optional[str] = Header(None)):
     """
     Handles incoming chat requests from the frontend, ensuring session persistence via user_id.
     get_session to retrieve the existing, latest session for the user,
@@ -147,6 +215,12 @@ async def chat_endpoint(request: ChatRequest):
     #     raise HTTPException(status_code=503, detail="Agent service is not initialized. Check server startup logs.")
 
 
+    started_at = time.time()
+    session = None
+    event_sequence = []
+    final_text = ""
+    status, error = 500, None
+
     try:
         # 1. Load the existing session for this user and app, or create a new one.
         
@@ -177,18 +251,23 @@ async def chat_endpoint(request: ChatRequest):
         # 2. Prepare Message Content
         content = types.Content(role="user", parts=[types.Part(text=request.message)])
         
-        final_text = ""
-        
+        # Stub mode only: replay.py says whether the recorded turn ran the pipeline
+        if STUB_MODEL and x_stub_pipeline is not None:
+            stub_run_pipeline.set(x_stub_pipeline == "1")
+
         # 3. Run the Agent Pipeline
         async for event in runner.run_async(
             user_id=session.user_id,
             session_id=session.id,
             new_message=content,
         ):
+            if CAPTURE_TRACE_FILE:
+                event_sequence.append(describe_event(event))
             if event.is_final_response() and event.content and event.content.parts:
                 final_text = event.content.parts[0].text
         
         # 4. Return the Agent's response
+        status = 200
         return {
             "response": final_text,
             "session_id": session.id,
@@ -197,9 +276,28 @@ async def chat_endpoint(request: ChatRequest):
 
     except Exception as e:
         print(f"An error occurred during chat processing: {e}")
+        error = type(e).__name__
         # Return a 500 status code with a helpful error message
         raise HTTPException(status_code=500, detail=f"Agent processing failed: {str(e)}")
 
+    finally:
+        # Runs after the response (or error) is decided; capture_trace never raises
+        if CAPTURE_TRACE_FILE:
+            record = {
+                "t": round(started_at, 3),
+                "user": anonymize_id(request.user_id),
+                "session": anonymize_id(session.id) if session else None,
+                "message": scrub_text(request.message),
+                "status": status,
+                "latency_ms": round((time.time() - started_at) * 1000, 1),
+                "events": event_sequence,
+            }
+            if status == 200:
+                record["response"] = scrub_text(final_text)
+            else:
+                record["error"] = error or "Cancelled"
+            await capture_trace(record)
+
 # ----------------------------------------------------------------------
 # 3. RUN THE SERVER (Instructions for the user)
 # ----------------------------------------------------------------------
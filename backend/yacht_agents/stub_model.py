@@ -0,0 +1,132 @@
+import json
+import random
+import asyncio
+from contextvars import ContextVar
+from typing import AsyncGenerator, Optional
+
+from google.adk.agents import LlmAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools import AgentTool
+from google.genai import types
+
+from sub_agents.custom_tools import yacht_seed, theme_templates, get_total_price
+
+
+# Offline stand-in for Gemini, used by server.py when STUB_MODEL=1 (e.g. for replay.py load tests).
+# Every agent gets canned, schema-valid output keyed by its name; agents that use a function tool
+# first call it once, so tool execution and session-DB writes follow the real event sequence.
+# STUB_LATENCY_MS / STUB_JITTER_MS add a per-call delay to mimic model latency.
+# Whether the Supervisor runs the pipeline or asks a follow-up question is decided per request
+# through `stub_run_pipeline` (server.py sets it from replay.py's X-Stub-Pipeline header).
+
+
+# --- 1. Canned outputs per agent
+
+STUB_YACHT = yacht_seed[0]
+STUB_THEME = theme_templates[1]
+STUB_DURATION_HR = 2
+
+STUB_REQUIREMENTS = {
+    "location": STUB_YACHT["location"], "date": "2025-12-31", "start_time": "22:00",
+    "duration_hr": STUB_DURATION_HR, "guests": 5, "occasion": "bachelor", "vibe": ["party"],
+    "budget_total": 40000, "confidence": 1.0,
+}
+
+STUB_PRICING = json.loads(get_total_price(STUB_YACHT["id"], STUB_DURATION_HR))
+
+STUB_PLAN = {
+    "yacht_id": STUB_YACHT["id"], "theme_id": STUB_THEME["id"], "pricing": STUB_PRICING,
+    "within_budget": STUB_PRICING["total_charter_cost"] <= STUB_REQUIREMENTS["budget_total"],
+}
+
+# agent name -> final text answer
+STUB_ANSWERS = {
+    "NeedsInterpreter": json.dumps(STUB_REQUIREMENTS),
+    "yachtMatcher": json.dumps(STUB_YACHT),
+    "ThemeAgent": json.dumps(STUB_THEME),
+    "SafetyAgent": "**Current Advisories and Forecast**\nClear skies, light winds.\n\n"
+                   "**Mandatory Safety Tips for the Guest**\n1. Wear life jackets when asked by the crew.",
+    "CompilationAgent": json.dumps(STUB_PLAN),
+    "PresentationAgent": f"Your {STUB_THEME['theme_name']} charter on {STUB_YACHT['yacht_name']} is ready "
+                         f"(total {STUB_PRICING['total_charter_cost']}).",
+}
+
+# agent name -> (function tool name, args) called once before answering
+STUB_TOOL_CALLS = {
+    "yachtMatcher": ("get_available_yachts", {}),
+    "ThemeAgent": ("get_available_themes", {}),
+    "CompilationAgent": ("get_total_price", {"yacht_id": STUB_YACHT["id"], "duration_hr": STUB_DURATION_HR}),
+}
+
+
+STUB_FOLLOW_UP = "Thanks! Could you confirm the date, start time, number of guests and budget?"
+
+# Per-request switch for the Supervisor: True = call planningPipeline, False = ask a follow-up,
+# None (no hint) = call planningPipeline
+stub_run_pipeline: ContextVar[Optional[bool]] = ContextVar("stub_run_pipeline", default=None)
+
+
+# --- 2. Stub model
+
+class StubLlm(BaseLlm):
+    """ BaseLlm that answers from the canned tables above instead of calling a model. """
+    agent_name: str
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        yield LlmResponse(content=self._reply(llm_request), turn_complete=True)
+
+    def _reply(self, llm_request: LlmRequest) -> types.Content:
+        last = llm_request.contents[-1] if llm_request.contents else None
+        responses = [p.function_response for p in (last.parts or [])] if last else []
+        responses = [r for r in responses if r]
+
+        # Supervisor: hand the turn to the pipeline (or ask a follow-up, as recorded), then relay its result
+        if self.agent_name == "Supervisor":
+            if responses:
+                result = (responses[0].response or {}).get("result", "")
+                return _text(result if isinstance(result, str) else json.dumps(result))
+            if stub_run_pipeline.get() is False:
+                return _text(STUB_FOLLOW_UP)
+            user_text = "".join(p.text for p in (last.parts or []) if p.text) if last else ""
+            return _call("planningPipeline", {"request": user_text})
+
+        tool_call = STUB_TOOL_CALLS.get(self.agent_name)
+        if tool_call and not responses:
+            return _call(*tool_call)
+        return _text(STUB_ANSWERS.get(self.agent_name, "OK"))
+
+
+def _text(text: str) -> types.Content:
+    return types.Content(role="model", parts=[types.Part(text=text)])
+
+
+def _call(name: str, args: dict) -> types.Content:
+    return types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))])
+
+
+# --- 3. Swap every LlmAgent in a tree (including agents wrapped in AgentTool) onto the stub
+
+def use_stub_models(agent, latency_ms: float = 0.0, jitter_ms: float = 0.0, _seen: Optional[set] = None):
+    seen = _seen if _seen is not None else set()
+    if id(agent) in seen:
+        return
+    seen.add(id(agent))
+
+    if isinstance(agent, LlmAgent):
+        # Keep the configured model name so model-specific request processing (e.g. google_search) still applies
+        model_name = agent.model if isinstance(agent.model, str) and agent.model else agent.canonical_model.model
+        agent.model = StubLlm(model=model_name, agent_name=agent.name, latency_ms=latency_ms, jitter_ms=jitter_ms)
+        for tool in agent.tools:
+            if isinstance(tool, AgentTool):
+                use_stub_models(tool.agent, latency_ms, jitter_ms, seen)
+    for sub_agent in agent.sub_agents:
+        use_stub_models(sub_agent, latency_ms, jitter_ms, seen)
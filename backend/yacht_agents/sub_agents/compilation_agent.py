@@ -1,6 +1,8 @@
 from google.adk.agents.llm_agent import Agent
 from google.adk.tools import FunctionTool
+from google.adk.agents.readonly_context import ReadonlyContext
 from .custom_tools import get_total_price
+from .schemas import CombinedPlan, make_output_guard, state_json
 
 
 
@@ -15,26 +17,34 @@ price_tool = FunctionTool(get_total_price)
 # This agent handles the final pricing and data compilation.
 
 # --- 3. # Compilation Agent (Sequential Step 3 )
-compilation_agent = Agent(
-    name="CompilationAgent",
-    model=gemini_model,
-     instruction=f"""
+# Upstream results are parsed objects in state; render them once as compact JSON
+def compilation_instruction(context: ReadonlyContext) -> str:
+    return f"""
                 You are the Planning Orchestrator. Your task is to compile the results from the parallel sub-agents
                 and finalize the cost calculation using the `price_tool`.
                 
-                **User Requirements:** {{user_requirements}}
-                **Yacht Match Result (JSON):** {{matched_yacht_data}}
-                **Theme Result (JSON):** {{matched_theme_data}}
+                **User Requirements:** {state_json(context.state, "user_requirements")}
+                **Yacht Match Result (JSON):** {state_json(context.state, "matched_yacht_data")}
+                **Theme Result (JSON):** {state_json(context.state, "matched_theme_data")}
                 
-                1. Read the `yacht_match_result` to get the `id` and `duration_hr` from the original `user_requirements`.
+                1. Read the `id` from the Yacht Match Result and `duration_hr` from the User Requirements.
                 2. Call the `price_tool(yacht_id, duration_hr)` to calculate the final cost.
                 3. Compile a single, final JSON object for the Presentation Agent containing:
-                   - The original `user_requirements`.
-                   - The `matched_yacht_data` (including routes).
-                   - The `matched_theme_data`.
-                   - The result from the `price_tool` (total cost breakdown).
-                4. **STRICT OUTPUT:** Return ONLY this single, compiled JSON object.
-                """,
+                   - `yacht_id` and `theme_id` of the matched yacht and theme (do NOT repeat their full data).
+                   - `pricing`: the result from the `price_tool` (total cost breakdown).
+                   - `within_budget`: whether `total_charter_cost` is within `budget_total` (null if no budget).
+                   - `notes`: optional short remarks (e.g. capacity or budget concerns).
+                4. If the yacht or theme `id` is "unmatched", or the `price_tool` returns an error, leave `pricing` null
+                   and explain the problem in `notes`.
+                5. **STRICT OUTPUT:** Return ONLY this single, compiled JSON object.
+                """
+
+compilation_agent = Agent(
+    name="CompilationAgent",
+    model=gemini_model,
+     instruction=compilation_instruction,
                 tools = [price_tool],
+                output_schema=CombinedPlan, # With tools, ADK returns the answer via set_model_response; the guard checks its args
+                after_model_callback=make_output_guard(CombinedPlan),
                 output_key="combined_plan_data", # Saves the compiled plan
     )
\ No newline at end of file
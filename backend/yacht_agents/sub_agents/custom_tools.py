@@ -54,7 +54,7 @@ def get_available_themes() -> str:
 def get_total_price(yacht_id: str, duration_hr: float) -> str: 
     """ Calculates the final cost for a specific yacht based on its rate_hr and the charter duration. """
     
-    yacht = next((y for y in yacht_seed_str if y['id'] == yacht_id), None)
+    yacht = next((y for y in yacht_seed if y['id'] == yacht_id), None)
     if not yacht:
         return json.dumps({"error": f"Yacht ID {yacht_id} not found."})
     
@@ -1,11 +1,23 @@
 from google.adk.agents.llm_agent import Agent
+from google.adk.agents.callback_context import CallbackContext
+from .schemas import UserRequirements, make_output_guard
+from .vocabulary import normalize_terms
 
 
 # --- 1. # Set LLM model 
 gemini_model = "gemini-2.0-flash"
 
 
-# --- 2. Needs Interpreter Agent (Sequential Step 1)   
+# --- 2. Map free-text occasion / vibe onto catalog tags locally (no model call)
+def add_canonical_tags(callback_context: CallbackContext):
+    requirements = callback_context.state.get("user_requirements")
+    if not isinstance(requirements, dict):
+        return None
+    callback_context.state["canonical_tags"] = normalize_terms(requirements.get("occasion"), requirements.get("vibe"))
+    return None
+
+
+# --- 3. Needs Interpreter Agent (Sequential Step 1)   
 
 needs_interpreter_agent = Agent(
     name="NeedsInterpreter",
@@ -38,5 +50,8 @@ needs_interpreter_agent = Agent(
                 3.  Ensure `vibe` is always an **array of strings**.                
                                 
                 """,
+                output_schema=UserRequirements, # Structured-output mode; parsed dict lands in state
+                after_model_callback=make_output_guard(UserRequirements),
+                after_agent_callback=add_canonical_tags, # Saves canonical occasion/vibe tags to state
                 output_key="user_requirements",
 )
\ No newline at end of file
@@ -1,6 +1,8 @@
 from google.adk.agents import Agent, ParallelAgent
 from google.adk.tools import AgentTool ,FunctionTool, google_search
+from google.adk.agents.readonly_context import ReadonlyContext
 from .custom_tools import search_weather, get_available_yachts, get_available_themes
+from .schemas import MatchedYacht, MatchedTheme, make_output_guard, state_json
 
 
 
@@ -18,48 +20,78 @@ theme_tool = FunctionTool(get_available_themes)
 # --- 3. Parallel Sub-Agents ---
 
 # 3a. Yacht Matcher Agent (Parallel Sub-Agent 1)
-yacht_matcher_agent = Agent(
-    name="yachtMatcher",
-    model=gemini_model, # Reasoning Power
-    instruction=f"""
+# user_requirements is a parsed object in state, so the prompt is rendered from compact JSON
+def yacht_matcher_instruction(context: ReadonlyContext) -> str:
+    return f"""
                 You are the Yacht Matching Specialist. Your task is to select the single best yacht
                 from the `yacht_tool` data that meets the user's requirements.
                 
-                **User Requirements (Input):** {{user_requirements}}
+                **User Requirements (Input):** {state_json(context.state, "user_requirements")}
+                **Canonical Catalog Tags (Input):** {state_json(context.state, "canonical_tags")}
                 
                 1. Call the `yacht_tool` to get the list of available yachts.
                 2. Filter and score the yachts based on the `location`, `guests` (max_capacity), `occasion`, and `vibe`.
+                   Prefer the Canonical Catalog Tags when comparing against each yacht's `occasion` and `vibe` lists.
                 3. Select the yacht that is the best overall match.
                 4. Output ONLY the complete, unfiltered JSON object of the single selected yacht, ensuring 
                    the `routes` array is included in the output.
-                """,
+                """
+
+yacht_matcher_agent = Agent(
+    name="yachtMatcher",
+    model=gemini_model, # Reasoning Power
+    instruction=yacht_matcher_instruction,
     tools=[yacht_tool],
     # input_key="user_requirements", # Explicitly consumes the JSON
-    output_key="matched_yacht_data" # Saves the single yacht JSON to state
+    output_schema=MatchedYacht, # With tools, ADK returns the answer via set_model_response; the guard checks its args
+    after_model_callback=make_output_guard(MatchedYacht),
+    output_key="matched_yacht_data" # Saves the single yacht object to state
 )
 
 # 3b. Theme Agent (Parallel Sub-Agent 2)
-theme_agent = Agent(
-    name="ThemeAgent",
-    model=gemini_model, # Reasoning Power
-    instruction=f"""
+def theme_instruction(context: ReadonlyContext) -> str:
+    return f"""
                 You are the Event Theme Designer. Your task is to select the single best theme 
                 template from the `theme_tool` data that meets the user's requirements.
                 
-                **User Requirements (Input):** {{user_requirements}}
+                **User Requirements (Input):** {state_json(context.state, "user_requirements")}
+                **Canonical Catalog Tags (Input):** {state_json(context.state, "canonical_tags")}
                 
                 1. Call the `theme_tool` to get the list of available themes.
-                2. Select the theme that best matches the user's `occasion` and `vibe`.
+                2. Select the theme that best matches the user's `occasion` and `vibe`, using the Canonical Catalog Tags
+                   to compare against each theme's `occasion_tags` and `vibe_tags`.
                 3. Output ONLY the complete, unfiltered JSON object of the single selected theme.
-                """,
+                """
+
+theme_agent = Agent(
+    name="ThemeAgent",
+    model=gemini_model, # Reasoning Power
+    instruction=theme_instruction,
     tools=[theme_tool],
     # input_key="user_requirements", # Explicitly consumes the JSON
-    output_key="matched_theme_data" # Saves the single theme JSON to state
+    output_schema=MatchedTheme, # With tools, ADK returns the answer via set_model_response; the guard checks its args
+    after_model_callback=make_output_guard(MatchedTheme),
+    output_key="matched_theme_data" # Saves the single theme object to state
 )
 
 
 
 # 3c. Safety Agent (Parallel Sub-Agent 3 )
+def safety_instruction(context: ReadonlyContext) -> str:
+    user_requirements = state_json(context.state, "user_requirements")
+    return f"""
+        You are the highly diligent **Safety and Feasibility Officer**. Your primary task is to assess the safety of the planned yacht charter.
+
+        **User Requirements (Input):** {user_requirements}
+
+        1.  **Use the `Google Search` tool** to find the current or expected weather, tide, and any relevant safety advisories (e.g., travel warnings, local port restrictions) for the `location` and `date` specified in the User Requirements.
+        2.  Based on the **{user_requirements}** (especially time, occasion, and location) and the **search results**, compile a list of **5 mandatory, key safety tips** that are highly relevant to the guest's specific situation. Focus on actions the Guest must take (e.g., adapting tips for night cruising, rough seas, local regulations, etc.).
+        3.  Do not make up weather or safety information; rely on the search results for specific, grounded advice.
+        4.  Your final response MUST be a single, structured summary. Do not use JSON or markdown headings. Use the following two section titles exactly:
+            - **Current Advisories and Forecast**
+            - **Mandatory Safety Tips for the Guest**
+        """
+
 safety_agent= Agent(
     name="SafetyAgent",
     model=gemini_model, # Reasoning Power
@@ -74,18 +106,7 @@ safety_agent= Agent(
     #                - Weather Forecast
     #                - Mandatory Safety Tips for the Guest
     #             """,
-    instruction=f"""
-        You are the highly diligent **Safety and Feasibility Officer**. Your primary task is to assess the safety of the planned yacht charter.
-
-        **User Requirements (Input):** {{user_requirements}}
-
-        1.  **Use the `Google Search` tool** to find the current or expected weather, tide, and any relevant safety advisories (e.g., travel warnings, local port restrictions) for the `location` and `date` specified in the User Requirements.
-        2.  Based on the **{{user_requirements}}** (especially time, occasion, and location) and the **search results**, compile a list of **5 mandatory, key safety tips** that are highly relevant to the guest's specific situation. Focus on actions the Guest must take (e.g., adapting tips for night cruising, rough seas, local regulations, etc.).
-        3.  Do not make up weather or safety information; rely on the search results for specific, grounded advice.
-        4.  Your final response MUST be a single, structured summary. Do not use JSON or markdown headings. Use the following two section titles exactly:
-            - **Current Advisories and Forecast**
-            - **Mandatory Safety Tips for the Guest**
-        """,
+    instruction=safety_instruction,
     
     # input_key="user_requirements", # Explicitly consumes the JSON from NeedsInterpreter
     output_key="safety_summary", # Saves summary to state
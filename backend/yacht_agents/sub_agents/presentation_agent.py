@@ -1,23 +1,33 @@
 from google.adk.agents.llm_agent import Agent
+from google.adk.agents.readonly_context import ReadonlyContext
+from .schemas import state_json
 
 # --- 1. # LLM model 
 gemini_model = "gemini-2.0-flash"
 
 
 # --- 2. Presentation Agent (Sequential Step 4)
-presentation_agent = Agent(
-    name="PresentationAgent",
-    model=gemini_model,
-    instruction=f"""
+def presentation_instruction(context: ReadonlyContext) -> str:
+    return f"""
                 You are the final Presentation Agent. Your task is to take the compiled plan data
                 and transform it into a professional, engaging, and charismatic final yacht charter itinerary for the user.
                 
-                **Planning Data (Input):** {{combined_plan_data}}
-                **Safety Summary (Input):** {{safety_summary}}
+                **User Requirements (Input):** {state_json(context.state, "user_requirements")}
+                **Yacht (Input):** {state_json(context.state, "matched_yacht_data")}
+                **Theme (Input):** {state_json(context.state, "matched_theme_data")}
+                **Planning Data (Input):** {state_json(context.state, "combined_plan_data")}
+                **Safety Summary (Input):** {context.state.get("safety_summary", "")}
                 
-                1. Use the data from {{combined_plan_data}} (yacht, theme, cost).
+                1. Use the yacht, theme and the cost from the Planning Data `pricing`.
                 2. Draft the final itinerary.
-                3. Include the safety information from {{safety_summary}} at the end.
-                4. Do NOT output JSON. Output a natural language, well-formatted response.
+                3. Include the safety information from the Safety Summary at the end.
+                4. If the yacht or theme `id` is "unmatched" or `pricing` is null, do not invent details: explain
+                   what is missing (see the Planning Data `notes`) and ask the user to adjust their request.
+                5. Do NOT output JSON. Output a natural language, well-formatted response.
                 """
+
+presentation_agent = Agent(
+    name="PresentationAgent",
+    model=gemini_model,
+    instruction=presentation_instruction
 )
@@ -0,0 +1,215 @@
+import re
+import json
+import logging
+from typing import List, Optional, Type
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmResponse
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+
+# --- 1. Stage output schemas
+# Each pipeline stage declares one of these as its `output_schema`, so the model runs in
+# structured-output mode and ADK stores the parsed dict (not a raw string) under the stage's output_key.
+
+
+# --- 1a. NeedsInterpreter -> state["user_requirements"]
+class UserRequirements(BaseModel):
+    """ Booking requirements extracted from the user's brief. Missing fields stay null. """
+    location: Optional[str] = Field(None, description="City or area name, lowercase (e.g. 'goa').")
+    date: Optional[str] = Field(None, description="YYYY-MM-DD, or 'YYYY-MM-DD to YYYY-MM-DD' for a range.")
+    start_time: Optional[str] = Field(None, description="Charter start time, HH:MM 24-hour format.")
+    duration_hr: Optional[float] = Field(None, description="Total charter duration in hours.")
+    guests: Optional[int] = Field(None, description="Total number of people.")
+    occasion: Optional[str] = Field(None, description="Purpose of the charter, lowercase (e.g. 'bachelor').")
+    vibe: Optional[List[str]] = Field(None, description="Adjectives describing the desired mood.")
+    budget_total: Optional[float] = Field(None, description="Total budget limit, numeric value only.")
+    special_requirements: Optional[str] = Field(None, description="Any specific needs (e.g. 'needs DJ').")
+    confidence: Optional[float] = Field(None, description="Assessment of the data quality, 0.0 to 1.0.")
+
+    @field_validator("location", "occasion")
+    @classmethod
+    def _lowercase(cls, value: Optional[str]) -> Optional[str]:
+        return value.strip().lower() if value else value
+
+    @field_validator("vibe", mode="before")
+    @classmethod
+    def _vibe_as_list(cls, value):
+        # The model sometimes answers with a single comma separated string
+        if isinstance(value, str):
+            return [v.strip().lower() for v in value.split(",") if v.strip()]
+        return value
+
+
+# --- 1b. yachtMatcher -> state["matched_yacht_data"] (mirrors an entry of yachts_seed.json)
+class MatchedYacht(BaseModel):
+    """ The single yacht selected from the catalog, including its routes. """
+    id: str
+    yacht_name: str
+    size_ft: Optional[float] = None
+    type: Optional[str] = None
+    max_capacity: int
+    crew: Optional[int] = None
+    location: str
+    rate_hr: float
+    min_duration_hr: Optional[float] = None
+    routes: List[str] = Field(default_factory=list)
+    boarding_point: Optional[str] = None
+    photos: Optional[str] = None
+    occasion: List[str] = Field(default_factory=list)
+    features: List[str] = Field(default_factory=list)
+    inclusions: List[str] = Field(default_factory=list)
+    food_included: Optional[bool] = None
+    vibe: List[str] = Field(default_factory=list)
+
+
+# --- 1c. ThemeAgent -> state["matched_theme_data"] (mirrors an entry of theme_templates.json)
+class MatchedTheme(BaseModel):
+    """ The single theme template selected from the catalog. """
+    id: str
+    theme_name: str
+    vibe_tags: List[str] = Field(default_factory=list)
+    occasion_tags: List[str] = Field(default_factory=list)
+    decor: List[str] = Field(default_factory=list)
+    music_keywords: List[str] = Field(default_factory=list)
+    mood_description: Optional[str] = None
+    food_and_drinks: List[str] = Field(default_factory=list)
+    recommended_timing: Optional[str] = None
+
+
+# --- 1d. CompilationAgent -> state["combined_plan_data"]
+class PriceBreakdown(BaseModel):
+    """ Result of the `price_tool` call. """
+    yacht_name: str
+    rate_per_hour: float
+    duration_hr: float
+    total_charter_cost: float
+    food_included: Optional[bool] = None
+
+
+class CombinedPlan(BaseModel):
+    """ The compiled plan. Yacht and theme are referenced by id; their full records
+    already live in state under `matched_yacht_data` / `matched_theme_data`. """
+    yacht_id: str
+    theme_id: str
+    pricing: Optional[PriceBreakdown] = Field(None, description="The `price_tool` result; null if pricing failed.")
+    within_budget: Optional[bool] = Field(None, description="True if total_charter_cost <= budget_total.")
+    notes: Optional[str] = Field(None, description="Short remarks for the Presentation Agent, if any.")
+
+
+# --- 2. Local validation, a single bounded repair and an explicit fallback
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+# Sentinel id used by the fallbacks below; downstream prompts and exports treat it as "no match"
+UNMATCHED_ID = "unmatched"
+
+# Schema-valid objects stored when a stage's output cannot be repaired, so one bad model reply
+# degrades the plan instead of failing the whole /chat request
+STAGE_FALLBACKS = {
+    UserRequirements: {"confidence": 0.0},
+    MatchedYacht: {"id": UNMATCHED_ID, "yacht_name": UNMATCHED_ID, "max_capacity": 0, "location": UNMATCHED_ID, "rate_hr": 0},
+    MatchedTheme: {"id": UNMATCHED_ID, "theme_name": UNMATCHED_ID},
+    CombinedPlan: {"yacht_id": UNMATCHED_ID, "theme_id": UNMATCHED_ID,
+                   "notes": "The plan could not be compiled. Ask the user to confirm their booking details."},
+}
+
+
+def parse_stage_output(schema: Type[BaseModel], value) -> Optional[BaseModel]:
+    """ Validates raw model output (text, or function-call args) against `schema`.
+    Fast path is a direct validation. If that fails, one repair pass strips
+    markdown fences / chatty prefixes and validates the outermost JSON object.
+    Returns None when the output cannot be repaired; there is no retry loop. """
+    if isinstance(value, dict):
+        try:
+            return schema.model_validate(value)
+        except ValidationError as e:
+            logger.warning("%s output could not be repaired: %s", schema.__name__, e)
+            return None
+    if not value or not value.strip():
+        return None
+
+    # --- 2a. fast path
+    try:
+        return schema.model_validate_json(value)
+    except ValidationError:
+        pass
+
+    # --- 2b. single repair pass
+    candidate = _FENCE_RE.sub("", value.strip())
+    start, end = candidate.find("{"), candidate.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        return schema.model_validate(json.loads(candidate[start:end + 1]))
+    except (ValueError, ValidationError) as e:
+        logger.warning("%s output could not be repaired: %s", schema.__name__, e)
+        return None
+
+
+def make_output_guard(schema: Type[BaseModel]):
+    """ Builds an `after_model_callback` that validates a stage's final answer locally.
+
+    It covers both ways ADK delivers a structured answer:
+    - agents without tools: the final text response (native structured-output mode);
+    - agents with tools (ADK >= 1.15): the args of the `set_model_response` function call
+      that ADK injects when `output_schema` and `tools` are combined.
+    Other tool calls are left untouched. A repairable answer is rewritten in canonical form;
+    anything else is replaced by the schema's entry in STAGE_FALLBACKS. """
+    fallback = schema.model_validate(STAGE_FALLBACKS[schema])
+
+    def _guard(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        content = llm_response.content
+        if llm_response.partial or not content or not content.parts:
+            return None
+
+        # --- tool-using agents: the answer arrives as set_model_response(**args)
+        calls = [part.function_call for part in content.parts if part.function_call]
+        if calls:
+            answers = [call for call in calls if call.name == "set_model_response"]
+            if not answers:
+                return None
+            for call in answers:
+                parsed = parse_stage_output(schema, dict(call.args or {}))
+                if parsed is None:
+                    logger.error("%s returned arguments that do not match %s; using fallback",
+                                 callback_context.agent_name, schema.__name__)
+                    parsed = fallback
+                call.args = parsed.model_dump(exclude_none=True)
+            return llm_response
+
+        # --- agents without tools: the answer is the final text
+        text = "".join(part.text for part in content.parts if part.text and not part.thought)
+        if not text:
+            return None
+
+        parsed = parse_stage_output(schema, text)
+        if parsed is None:
+            logger.error("%s returned output that does not match %s; using fallback",
+                         callback_context.agent_name, schema.__name__)
+            parsed = fallback
+
+        canonical = parsed.model_dump_json(exclude_none=True)
+        if canonical == text:
+            return None
+        llm_response.content = types.Content(role=content.role, parts=[types.Part(text=canonical)])
+        return llm_response
+
+    return _guard
+
+
+# --- 3. Compact state rendering for downstream prompts
+
+def state_json(state, key: str) -> str:
+    """ Renders a state value for prompt interpolation. Parsed objects are dumped as
+    compact JSON; legacy string values (older sessions) are passed through as-is. """
+    value = state.get(key)
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,246 @@
+import re
+import math
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .custom_tools import yacht_seed, theme_templates
+
+
+# Offline, CPU-only mapping from free-text vibe / occasion phrases ("sundowner with my wife",
+# "office offsite", "stag do") to the canonical tags used in yachts_seed.json and theme_templates.json.
+# Lookup order: exact tag / synonym for the whole phrase, then per bigram and token, with hashed
+# character n-gram similarity for out-of-vocabulary tokens; whole-phrase n-gram match as a last resort.
+
+
+# --- 1. Canonical vocabulary (built from the catalogs)
+
+def _collect(records: Iterable[dict], *keys: str) -> set:
+    return {tag.lower() for r in records for k in keys for tag in r.get(k, [])}
+
+OCCASION_TAGS = _collect(yacht_seed, "occasion") | _collect(theme_templates, "occasion_tags")
+VIBE_TAGS = _collect(yacht_seed, "vibe") | _collect(theme_templates, "vibe_tags")
+
+VOCABULARY = {"occasion": OCCASION_TAGS, "vibe": VIBE_TAGS}
+
+
+# --- 2. Synonym graph
+# phrase or keyword -> canonical tags. Tags missing from the catalog are dropped when the graph is built,
+# so the matcher can only ever return tags that exist.
+
+SYNONYMS: Dict[str, List[str]] = {
+    # occasions
+    "stag": ["bachelor"], "stag do": ["bachelor"], "stag party": ["bachelor"], "bachelors": ["bachelor"],
+    "hen": ["bachelorette"], "hen do": ["bachelorette"], "hen party": ["bachelorette"], "bridal shower": ["bachelorette"],
+    "bday": ["birthday party", "birthday"], "birthday": ["birthday party", "birthday"], "turning": ["birthday party", "birthday"],
+    "birthday party": ["birthday party", "birthday"],
+    "anniversary": ["anniversary"], "wife": ["couple"], "husband": ["couple"],
+    "work anniversary": ["corporate"],
+    "partner": ["couple"], "girlfriend": ["couple"], "boyfriend": ["couple"], "date": ["couple", "romantic"],
+    "date night": ["couple", "romantic"], "honeymoon": ["couple", "romantic"],
+    "propose": ["wedding proposal", "proposal"], "proposal": ["wedding proposal", "proposal"],
+    "wedding proposal": ["wedding proposal", "proposal"],
+    "engagement": ["wedding proposal", "proposal"], "pop the question": ["wedding proposal", "proposal"],
+    "offsite": ["corporate", "business meeting"], "office": ["corporate"], "team": ["corporate"],
+    "team outing": ["corporate"], "client": ["business meeting", "corporate"], "business": ["business meeting", "corporate"],
+    "company": ["corporate"], "colleagues": ["corporate"],
+    "family": ["family hangout", "family"], "family hangout": ["family hangout", "family"],
+    "kids": ["kids", "family hangout"], "children": ["kids", "family hangout"], "play date": ["kids", "family hangout", "family"],
+    "parents": ["family hangout", "family"], "reunion": ["family hangout"],
+    "photo": ["photoshoot"], "photos": ["photoshoot"], "shoot": ["photoshoot"], "pre wedding": ["photoshoot"],
+    "snorkel": ["snorkeling"], "diving": ["snorkeling"], "scuba": ["snorkeling"],
+    "explore": ["exploration", "day trip"], "island hopping": ["exploration", "day trip"], "day out": ["day trip"],
+    "vip": ["vip"], "yoga": ["wellness"], "retreat": ["wellness"], "spa": ["wellness"],
+    # vibes
+    "sundowner": ["sunset", "romantic"], "sunset": ["sunset"], "golden hour": ["sunset"],
+    "sunrise": ["sunrise"], "dawn": ["sunrise"], "early morning": ["sunrise", "serene"],
+    "romance": ["romantic"], "romantic": ["romantic"], "intimate": ["romantic", "calm"],
+    "party": ["party"], "celebration": ["party"], "dj": ["party", "loud"], "dance": ["party", "energetic"],
+    "rave": ["party", "loud", "energetic"], "lit": ["party", "energetic"], "wild": ["party", "loud"],
+    "new year": ["party", "night"], "nye": ["party", "night"], "night": ["night"], "late night": ["night", "party"],
+    "chill": ["chill"], "relax": ["relaxed", "chill"], "relaxing": ["relaxed", "chill"], "laid back": ["chill", "relaxed"],
+    "quiet": ["calm", "serene"], "peaceful": ["calm", "serene"], "calm": ["calm"],
+    "fancy": ["luxury", "premium"], "classy": ["luxury", "premium"], "posh": ["luxury", "exclusive"],
+    "private": ["exclusive"], "high end": ["luxury", "premium"], "lavish": ["luxury"],
+    "cheap": ["budget"], "affordable": ["budget"], "value": ["budget"],
+    "nature": ["nature"], "wildlife": ["nature"], "dolphins": ["nature", "adventure"],
+    "adventure": ["adventure"], "thrill": ["adventure", "energetic"], "dancing": ["party", "energetic"], "outdoors": ["outdoor"],
+    "formal": ["corporate"], "professional": ["corporate"],
+}
+
+
+def _build_graph(kind: str) -> Dict[str, Tuple[str, ...]]:
+    allowed = VOCABULARY[kind]
+    graph = {}
+    for phrase, tags in SYNONYMS.items():
+        hits = tuple(t for t in tags if t in allowed)
+        if hits:
+            graph[phrase] = hits
+    return graph
+
+SYNONYM_GRAPH = {kind: _build_graph(kind) for kind in VOCABULARY}
+
+
+# --- 3. Hashed character n-gram index (fallback for typos and near-misses, e.g. "bachlor", "luxurious")
+
+NGRAM_DIM = 2048
+NGRAM_THRESHOLD = 0.55
+
+
+def _vectorize(text: str) -> Dict[int, float]:
+    """ Sparse, L2-normalised vector of hashed character trigrams. """
+    padded = f"  {text}  "
+    counts: Dict[int, float] = {}
+    for i in range(len(padded) - 2):
+        bucket = zlib.crc32(padded[i:i + 3].encode()) % NGRAM_DIM
+        counts[bucket] = counts.get(bucket, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+
+def _cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+# Whole-phrase index: every canonical tag
+NGRAM_INDEX = {kind: [(tag, _vectorize(tag)) for tag in sorted(tags)] for kind, tags in VOCABULARY.items()}
+
+
+def _build_token_index(kind: str) -> List[Tuple[str, Tuple[str, ...], Dict[int, float]]]:
+    # Per-token index: single-word tags and single-word synonym keys, each with the tags it maps to
+    entries = {tag: (tag,) for tag in VOCABULARY[kind] if " " not in tag}
+    entries.update({key: tags for key, tags in SYNONYM_GRAPH[kind].items() if " " not in key})
+    return [(key, tags, _vectorize(key)) for key, tags in sorted(entries.items())]
+
+TOKEN_INDEX = {kind: _build_token_index(kind) for kind in VOCABULARY}
+
+# Words the vocabulary already knows (in any kind). Only out-of-vocabulary tokens are treated as
+# possible typos, so e.g. "wife" never drifts to "wildlife" when looking up vibes.
+KNOWN_WORDS = {word for phrase in (*SYNONYMS, *OCCASION_TAGS, *VIBE_TAGS) for word in phrase.split()}
+
+
+# --- 4. Public API
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SUFFIX_RE = re.compile(r"(?:ing|ous|ed|es|s)$")
+
+# Filler words never sent to the fuzzy matcher
+STOPWORDS = {"a", "an", "and", "the", "with", "for", "my", "our", "his", "her", "their", "of", "to",
+             "on", "in", "at", "some", "few", "very", "want", "need", "like", "just", "also", "plus"}
+
+FUZZY_MIN_LEN = 4
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """ Levenshtein distance (single-row DP; inputs are single words). """
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _max_edits(word: str) -> int:
+    # Short words tolerate one typo, longer words two ("update" must not become "date")
+    return 1 if len(word) <= 7 else 2
+
+
+def _nearest(query: str, index) -> Tuple[Tuple[str, ...], float]:
+    vector = _vectorize(query)
+    best_tags, best_score = (), 0.0
+    for tags, candidate in index:
+        score = _cosine(vector, candidate)
+        if score > best_score:
+            best_tags, best_score = tags, score
+    return best_tags, best_score
+
+
+def _fuzzy_token(token: str, kind: str) -> Tuple[str, ...]:
+    """ Nearest single-word tag / synonym for one out-of-vocabulary token, also trying it without
+    a common suffix ("dancing" -> "danc", "luxurious" -> "luxuri"). Trigram similarity ranks the
+    candidates; a match is only accepted within a small edit distance of the word. """
+    if len(token) < FUZZY_MIN_LEN or token in STOPWORDS or token in KNOWN_WORDS or token.isdigit():
+        return ()
+    queries = [token]
+    stem = _SUFFIX_RE.sub("", token)
+    if stem != token and len(stem) >= FUZZY_MIN_LEN:
+        queries.append(stem)
+
+    best_tags, best_score = (), 0.0
+    for query in queries:
+        vector = _vectorize(query)
+        for key, tags, candidate in TOKEN_INDEX[kind]:
+            score = _cosine(vector, candidate)
+            if score >= NGRAM_THRESHOLD and score > best_score and _edit_distance(query, key) <= _max_edits(query):
+                best_tags, best_score = tags, score
+    return best_tags
+
+
+def _exact(term: str, kind: str) -> Tuple[str, ...]:
+    """ Exact tag and/or synonym entry for a term, merged ("birthday" -> birthday, birthday party). """
+    tags = (term,) if term in VOCABULARY[kind] else ()
+    return tags + tuple(t for t in SYNONYM_GRAPH[kind].get(term, ()) if t not in tags)
+
+
+@lru_cache(maxsize=2048)
+def normalize_phrase(phrase: str, kind: str = "occasion") -> Tuple[str, ...]:
+    """ Maps one free-text phrase to canonical catalog tags of `kind` ('occasion' or 'vibe').
+    Returns an empty tuple when nothing is close enough. Results are memoised per phrase. """
+    if kind not in VOCABULARY:
+        raise ValueError(f"Unknown vocabulary kind: {kind}")
+
+    tokens = _TOKEN_RE.findall(phrase.lower())
+    text = " ".join(tokens)
+    if not text:
+        return ()
+
+    # --- 4a. exact canonical tag and/or synonym for the whole phrase
+    whole = _exact(text, kind)
+    if whole:
+        return whole
+
+    found: List[str] = []
+
+    def _add(tags: Iterable[str]):
+        found.extend(t for t in tags if t not in found)
+
+    # --- 4b. exact tag / synonym on token bigrams; matched bigrams consume their tokens
+    consumed = set()
+    for i in range(len(tokens) - 1):
+        gram = f"{tokens[i]} {tokens[i + 1]}"
+        tags = _exact(gram, kind)
+        if tags:
+            _add(tags)
+            consumed.update((i, i + 1))
+
+    # --- 4c. exact tag / synonym per remaining token, else nearest by hashed n-gram similarity
+    for i, token in enumerate(tokens):
+        if i in consumed:
+            continue
+        _add(_exact(token, kind) or _fuzzy_token(token, kind))
+    if found:
+        return tuple(found)
+
+    # --- 4d. nearest multi-word tag for the whole phrase (e.g. "bday prty" -> "birthday party")
+    tags, score = _nearest(text, [((tag,), vector) for tag, vector in NGRAM_INDEX[kind]])
+    return tags if score >= NGRAM_THRESHOLD else ()
+
+
+def normalize_terms(occasion: Optional[str] = None, vibe: Optional[Iterable[str]] = None) -> dict:
+    """ Normalises a requirements' `occasion` and `vibe` into canonical catalog tags.
+    The occasion phrase also contributes vibe tags (e.g. "sundowner with my wife" -> sunset, romantic). """
+    occasion_tags: List[str] = []
+    vibe_tags: List[str] = []
+
+    def _extend(target: List[str], tags: Tuple[str, ...]):
+        target.extend(t for t in tags if t not in target)
+
+    if occasion:
+        _extend(occasion_tags, normalize_phrase(occasion, "occasion"))
+        _extend(vibe_tags, normalize_phrase(occasion, "vibe"))
+    for term in vibe or []:
+        _extend(vibe_tags, normalize_phrase(term, "vibe"))
+    return {"occasion_tags": occasion_tags, "vibe_tags": vibe_tags}